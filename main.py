@@ -1,5 +1,6 @@
 import sys
 import pygame
+import numpy as np
 from src.audio import AudioAnalyzer
 from src.graphics import GraphicsEngine
 
@@ -16,11 +17,12 @@ def main():
         audio.start()
         
         print("Starting Main Loop...", flush=True)
+        spectrum = np.empty(audio.num_bins, dtype=np.float32)
         running = True
         while running:
             # Get Audio Data
             bass, mid, treble = audio.get_audio_levels()
-            spectrum = audio.get_spectrum()
+            audio.get_spectrum(out=spectrum)
             
             # Render Frame
             running = graphics.render(bass, mid, treble, spectrum)
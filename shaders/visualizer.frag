@@ -1,32 +1,43 @@
 #version 330
 uniform sampler2D tex;
 uniform sampler2D spectrum_tex;  // 64x1 texture with spectrum bins
-uniform float time;
-uniform float bass;
-uniform float mid;
-uniform float treble;
-uniform vec2 resolution;
-
-// Effect toggles (0.0 = off, 1.0 = on)
-uniform float fx_zoom;
-uniform float fx_ripple;
-uniform float fx_wave;
-uniform float fx_chromatic;
-uniform float fx_edge_glow;
-
-// Other effects
-uniform float fx_bars;
-uniform float fx_circle;
-uniform float fx_colormask;
-uniform float fx_destellos;  // Audio-reactive glow ("destellos")
+
+// Values that change every frame, uploaded together as one buffer
+// (std140 offsets in bytes; GraphicsEngine writes the same layout)
+layout(std140) uniform Frame {
+    vec2 resolution;     // 0
+    vec2 uv_scale;       // 8   Cover-fit: screen UV -> image UV
+    vec2 uv_offset;      // 16
+    float time;          // 24
+    float bass;          // 28
+    float mid;           // 32
+    float treble;        // 36
+};
+
+// Effect toggles, one bit per effect (bit order matches _EFFECT_UNIFORMS
+// in graphics.py), so a menu change is a single uniform upload
+uniform uint fx_mask;
+
+#define fx_zoom      ((fx_mask & 1u) != 0u)
+#define fx_ripple    ((fx_mask & 2u) != 0u)
+#define fx_wave      ((fx_mask & 4u) != 0u)
+#define fx_chromatic ((fx_mask & 8u) != 0u)
+#define fx_edge_glow ((fx_mask & 16u) != 0u)
+#define fx_destellos ((fx_mask & 32u) != 0u)   // Audio-reactive glow ("destellos")
+#define fx_bars      ((fx_mask & 64u) != 0u)
+#define fx_circle    ((fx_mask & 128u) != 0u)
+#define fx_colormask ((fx_mask & 256u) != 0u)
 
 // Audio Source Selectors (0=Bass, 1=Mid, 2=Treble)
-uniform int src_zoom;
-uniform int src_ripple;
-uniform int src_wave;
-uniform int src_chromatic;
-uniform int src_edge_glow;
-uniform int src_destellos;
+uniform ivec4 src0;          // zoom, ripple, wave, chromatic
+uniform ivec2 src1;          // edge_glow, destellos
+
+#define src_zoom      src0.x
+#define src_ripple    src0.y
+#define src_wave      src0.z
+#define src_chromatic src0.w
+#define src_edge_glow src1.x
+#define src_destellos src1.y
 
 in vec2 v_uv;
 out vec4 f_color;
@@ -41,6 +52,11 @@ float get_source(int id) {
     return treble;
 }
 
+// Sample the background image at a screen UV (cover-fit crop)
+vec4 sample_bg(vec2 screen_uv) {
+    return texture(tex, screen_uv * uv_scale + uv_offset);
+}
+
 // Read a spectrum bin (0-63) from the 1D spectrum texture
 float get_bin(float index) {
     return texture(spectrum_tex, vec2((index + 0.5) / NUM_BINS, 0.5)).r;
@@ -54,14 +70,14 @@ void main() {
     // ========== DISTORTION EFFECTS ==========
     
     // 1. Zoom Pulse
-    if (fx_zoom > 0.5) {
+    if (fx_zoom) {
         float src = get_source(src_zoom);
         float zoom = 1.0 - (src * 0.04);
         uv = center + (uv - center) * zoom;
     }
     
     // 2. Ripple
-    if (fx_ripple > 0.5) {
+    if (fx_ripple) {
         float src = get_source(src_ripple);
         float ripple = sin(dist * 20.0 - time * 5.0) * 0.5 + 0.5;
         float ds = src * 0.035;
@@ -70,7 +86,7 @@ void main() {
     }
 
     // 3. Wave Warp
-    if (fx_wave > 0.5) {
+    if (fx_wave) {
         float src = get_source(src_wave);
         float wave_x = sin(uv.y * 15.0 + time * 3.0) * src * 0.03;
         float wave_y = cos(uv.x * 12.0 + time * 2.5) * src * 0.02;
@@ -79,31 +95,31 @@ void main() {
 
     // Sample background (with Chromatic Aberration if enabled)
     float r, g, b;
-    bool chromatic_active = (fx_chromatic > 0.5);
+    bool chromatic_active = fx_chromatic;
     
     if (chromatic_active) {
         float src = get_source(src_chromatic);
         // Shift depends on intensity
         float shift = src * 0.02 + 0.002; 
         
-        r = texture(tex, uv + vec2(shift, shift * 0.5)).r;
-        g = texture(tex, uv).g;
-        b = texture(tex, uv - vec2(shift, shift * 0.5)).b;
+        r = sample_bg(uv + vec2(shift, shift * 0.5)).r;
+        g = sample_bg(uv).g;
+        b = sample_bg(uv - vec2(shift, shift * 0.5)).b;
     } else {
-        vec3 c = texture(tex, uv).rgb;
+        vec3 c = sample_bg(uv).rgb;
         r = c.r; g = c.g; b = c.b;
     }
     vec3 color = vec3(r, g, b);
 
     // 4. Edge Glow
-    if (fx_edge_glow > 0.5) {
+    if (fx_edge_glow) {
         float src = get_source(src_edge_glow);
         if (src > 0.05) {
             vec2 px = vec2(1.0) / resolution;
-            vec3 left_c  = texture(tex, uv - vec2(px.x, 0.0)).rgb;
-            vec3 right_c = texture(tex, uv + vec2(px.x, 0.0)).rgb;
-            vec3 up_c    = texture(tex, uv - vec2(0.0, px.y)).rgb;
-            vec3 down_c  = texture(tex, uv + vec2(0.0, px.y)).rgb;
+            vec3 left_c  = sample_bg(uv - vec2(px.x, 0.0)).rgb;
+            vec3 right_c = sample_bg(uv + vec2(px.x, 0.0)).rgb;
+            vec3 up_c    = sample_bg(uv - vec2(0.0, px.y)).rgb;
+            vec3 down_c  = sample_bg(uv + vec2(0.0, px.y)).rgb;
             
             float edge = length(right_c - left_c) + length(down_c - up_c);
             
@@ -118,13 +134,13 @@ void main() {
     color *= mix(0.7, 1.0, vig_raw);
 
     // Destellos (audio-reactive glow)
-    if (fx_destellos > 0.5) {
+    if (fx_destellos) {
         float src = get_source(src_destellos);
         color += vec3(src * 0.08);
     }
 
     // ========== FREQUENCY BARS ==========
-    if (fx_bars > 0.5) {
+    if (fx_bars) {
         float bar_region_h = 0.35;  // Bars occupy bottom 35%
         float bar_y_start = 1.0 - bar_region_h;
         
@@ -163,7 +179,7 @@ void main() {
     }
 
     // ========== CIRCULAR VISUALIZER ==========
-    if (fx_circle > 0.5) {
+    if (fx_circle) {
         vec2 aspect_uv = vec2(v_uv.x, v_uv.y * resolution.y / resolution.x);
         vec2 aspect_center = vec2(0.5, 0.5 * resolution.y / resolution.x);
         
@@ -213,7 +229,7 @@ void main() {
     }
 
     // ========== COLOR MASK BARS ==========
-    if (fx_colormask > 0.5) {
+    if (fx_colormask) {
         // Save original color
         vec3 original_color = color;
         
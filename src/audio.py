@@ -6,11 +6,44 @@ import pyaudiowpatch as pyaudio
 import numpy as np
 import threading
 
+class RingBuffer:
+    """Single-producer / single-consumer float32 ring buffer.
+    
+    The audio callback is the only writer and only advances `write_pos`
+    (a monotonically increasing sample counter); the analysis thread only
+    reads. No lock is needed under the GIL.
+    """
+    def __init__(self, capacity):
+        # Round up to a power of two so wrap-around is a bit mask
+        size = 1 << (capacity - 1).bit_length()
+        self._buf = np.zeros(size, dtype=np.float32)
+        self._mask = size - 1
+        self.write_pos = 0
+    
+    def push(self, data):
+        n = len(data)
+        start = self.write_pos & self._mask
+        first = min(n, len(self._buf) - start)
+        self._buf[start:start + first] = data[:first]
+        self._buf[:n - first] = data[first:]
+        self.write_pos += n
+    
+    def read_latest(self, out, write_pos):
+        """Copy the len(out) samples that end at write_pos into out."""
+        n = len(out)
+        start = (write_pos - n) & self._mask
+        first = min(n, len(self._buf) - start)
+        out[:first] = self._buf[start:start + first]
+        out[first:] = self._buf[:n - first]
+        return out
+
 class AudioAnalyzer:
-    def __init__(self, sample_rate=None, buffer_size=2048):
+    def __init__(self, sample_rate=None, buffer_size=1024):
+        # FFT size; a new FFT runs every hop_size samples (overlapping
+        # windows, set once the sample rate is known)
         self.buffer_size = buffer_size
+        self.hop_size = None
         self.running = False
-        self.lock = threading.Lock()
         
         # These will be set when we find the loopback device
         self.sample_rate = sample_rate
@@ -18,22 +51,75 @@ class AudioAnalyzer:
         self.device_index = None
         self.device_name = "No device"
         
-        # Audio Data
-        self.bass = 0.0
-        self.mid = 0.0
-        self.treble = 0.0
-        
         # Spectrum bins (64 logarithmic bins for visualizer bars/circle)
         self.num_bins = 64
-        self.spectrum_bins = np.zeros(self.num_bins, dtype=np.float32)
         
-        # Smoothing (0.0 = no smoothing, 1.0 = frozen)
+        # Audio Data, double-buffered: the capture thread writes the back
+        # buffer and then flips self._front, so readers never need a lock
+        # (a single int store is atomic under the GIL).
+        self._levels = [np.zeros(3, dtype=np.float32) for _ in range(2)]  # bass, mid, treble
+        self._spectra = [np.zeros(self.num_bins, dtype=np.float32) for _ in range(2)]
+        self._front = 0
+        
+        # Smoothing (0.0 = no smoothing, 1.0 = frozen), per 2048 samples;
+        # rescaled to the hop size so the decay time doesn't depend on it
         self.smooth_factor = 0.7
         self.spectrum_smooth = 0.6
         
+        # Capture ring buffers, one per channel (planar L/R, filled by the
+        # stream callback), and the frames the analysis thread copies out
+        self._ring_l = RingBuffer(4 * self.buffer_size)
+        self._ring_r = RingBuffer(4 * self.buffer_size)
+        self._data_ready = threading.Event()
+        self._frame_l = np.zeros(self.buffer_size, dtype=np.float32)
+        self._frame_r = np.zeros(self.buffer_size, dtype=np.float32)
+        self._frame = np.zeros(self.buffer_size, dtype=np.float32)  # mono mix
+        
+        # Hanning window (computed once, reused every frame)
+        self._window = np.hanning(self.buffer_size).astype(np.float32)
+        
         # Find loopback device at init
         self._find_loopback_device()
         
+        # One analysis per rendered frame (~60 fps): a shorter hop would
+        # compute spectra that are never drawn
+        self.hop_size = min(self.buffer_size, round(self.sample_rate / 60))
+        self._smooth_exp = self.hop_size / 2048
+        
+        # FFT bin frequencies (fixed once sample_rate is known)
+        self._freqs = np.fft.rfftfreq(self.buffer_size, 1/self.sample_rate).astype(np.float32)
+        
+        # FFT index ranges: the 3 bands (bass, mid, treble) followed by the
+        # 64 log bins. freqs never change, so these are resolved once.
+        self._log_edges = np.logspace(np.log10(20), np.log10(16000), self.num_bins + 1)
+        ranges = [(20, 250), (250, 4000), (4000, 16000)]
+        ranges += [(self._log_edges[i], self._log_edges[i + 1]) for i in range(self.num_bins)]
+        self._starts = np.searchsorted(self._freqs, [low for low, _ in ranges])
+        self._stops = np.searchsorted(self._freqs, [high for _, high in ranges])
+        # Narrow low-frequency bins can fall between FFT bins: use the FFT
+        # bin closest to their center so those bars don't stay dark
+        empty = self._stops <= self._starts
+        if np.any(empty):
+            centers = np.sqrt([low * high for low, high in ranges])[empty]
+            bin_width = self._freqs[1]
+            nearest = np.clip(np.rint(centers / bin_width).astype(int), 0, len(self._freqs) - 1)
+            self._starts[empty] = nearest
+            self._stops[empty] = nearest + 1
+        self._counts = self._stops - self._starts
+        
+        # References were tuned with a 2048-sample FFT. The mean magnitude of
+        # broadband (noise-like) content grows with sqrt(FFT size), so scale
+        # them to keep the same levels at other sizes.
+        level_scale = np.sqrt(self.buffer_size / 2048)
+        self._band_refs = (50.0 * level_scale, 10.0 * level_scale, 3.0 * level_scale)
+        # Per-bin normalization reference (from test: bass peaks ~90, treble ~3).
+        # Low bins get more energy, so use per-bin scaling
+        self._ref_scale = (np.linspace(40.0, 3.0, self.num_bins) * level_scale).astype(np.float32)
+        self._bins = np.empty(self.num_bins, dtype=np.float32)
+        
+        # Prefix-sum scratch buffer (index 0 stays 0.0)
+        self._csum = np.zeros(len(self._freqs) + 1, dtype=np.float64)
+        
     def _find_loopback_device(self):
         """Find the WASAPI loopback device for the default output."""
         p = pyaudio.PyAudio()
@@ -106,6 +192,23 @@ class AudioAnalyzer:
         if hasattr(self, 'thread'):
             self.thread.join(timeout=2)
 
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        """Stream callback: de-interleave into the per-channel ring buffers."""
+        samples = np.frombuffer(in_data, dtype=np.float32).reshape(-1, self.channels)
+        
+        if self.channels == 2:
+            left, right = samples[:, 0], samples[:, 1]
+        elif self.channels > 2:
+            # Surround: fold everything down into both channels
+            left = right = samples.mean(axis=1)
+        else:
+            left = right = samples[:, 0]
+        
+        self._ring_l.push(left)
+        self._ring_r.push(right)
+        self._data_ready.set()
+        return (None, pyaudio.paContinue)
+
     def _capture_loop(self):
         p = pyaudio.PyAudio()
         
@@ -116,18 +219,32 @@ class AudioAnalyzer:
                 rate=self.sample_rate,
                 input=True,
                 input_device_index=self.device_index,
-                frames_per_buffer=self.buffer_size,
+                frames_per_buffer=self.hop_size,
+                stream_callback=self._on_audio,
             )
+            stream.start_stream()
             
+            read_pos = 0
             while self.running:
-                data = stream.read(self.buffer_size, exception_on_overflow=False)
-                samples = np.frombuffer(data, dtype=np.float32)
+                if not self._data_ready.wait(timeout=0.5):
+                    continue
+                self._data_ready.clear()
                 
-                # Mono conversion
-                if self.channels > 1:
-                    samples = samples.reshape(-1, self.channels).mean(axis=1)
+                write_pos = self._ring_r.write_pos  # R is pushed last
+                if write_pos - read_pos < self.hop_size:
+                    continue
                 
-                self._process_audio(samples)
+                # Always analyze the newest buffer_size samples (overlapping
+                # the previous FFT); if we fell behind, the stale audio is
+                # dropped instead of stalling the callback.
+                self._ring_l.read_latest(self._frame_l, write_pos)
+                self._ring_r.read_latest(self._frame_r, write_pos)
+                read_pos = write_pos
+                
+                # Mono mix for the FFT, from the contiguous channel frames
+                np.add(self._frame_l, self._frame_r, out=self._frame)
+                self._frame *= 0.5
+                self._process_audio(self._frame)
             
             stream.stop_stream()
             stream.close()
@@ -138,61 +255,79 @@ class AudioAnalyzer:
             p.terminate()
 
     def _process_audio(self, data):
+        # Silent output (very common): skip the FFT, just decay toward zero
+        if max(data.max(), -data.min()) < 1e-5:
+            self._publish(0.0, 0.0, 0.0, None)
+            return
+        
         # Hanning window
-        windowed = data * np.hanning(len(data))
+        windowed = data * self._window
         
-        # FFT
+        # FFT magnitude. Levels stay means of |X| rather than power means
+        # with one sqrt per band: the references are tuned on mean
+        # magnitudes, and an RMS over a wide band weights tones toward
+        # their peak
         fft = np.abs(np.fft.rfft(windowed))
-        freqs = np.fft.rfftfreq(len(data), 1/self.sample_rate)
         
-        # Energy per band
-        def band_energy(low, high):
-            mask = (freqs >= low) & (freqs < high)
-            return np.mean(fft[mask]) if np.any(mask) else 0.0
-        
-        bass_raw = band_energy(20, 250)
-        mid_raw = band_energy(250, 4000)
-        treble_raw = band_energy(4000, 16000)
+        # Mean magnitude of every band and bin in a single pass:
+        # prefix sums, then one gather per range
+        np.cumsum(fft, dtype=np.float64, out=self._csum[1:])
+        means = (self._csum[self._stops] - self._csum[self._starts]) / self._counts
+        bass_raw, mid_raw, treble_raw = means[:3]
         
         # Scale
-        bass_scaled = min(bass_raw / 50.0, 2.0)
-        mid_scaled = min(mid_raw / 10.0, 2.0)
-        treble_scaled = min(treble_raw / 3.0, 2.0)
+        bass_ref, mid_ref, treble_ref = self._band_refs
+        bass_scaled = min(bass_raw / bass_ref, 2.0)
+        mid_scaled = min(mid_raw / mid_ref, 2.0)
+        treble_scaled = min(treble_raw / treble_ref, 2.0)
         
         # Spectrum bins (64 log-spaced bins)
-        new_bins = self._compute_spectrum_bins(fft, freqs)
-        
-        # Smooth everything
-        s = self.smooth_factor
-        ss = self.spectrum_smooth
-        with self.lock:
-            self.bass = self.bass * s + bass_scaled * (1 - s)
-            self.mid = self.mid * s + mid_scaled * (1 - s)
-            self.treble = self.treble * s + treble_scaled * (1 - s)
-            self.spectrum_bins = self.spectrum_bins * ss + new_bins * (1 - ss)
+        new_bins = self._compute_spectrum_bins(means[3:])
+        
+        self._publish(bass_scaled, mid_scaled, treble_scaled, new_bins)
 
-    def _compute_spectrum_bins(self, fft, freqs):
-        """Compute 64 logarithmically-spaced spectrum bins."""
-        log_edges = np.logspace(np.log10(20), np.log10(16000), self.num_bins + 1)
-        bins = np.zeros(self.num_bins, dtype=np.float32)
-        
-        for i in range(self.num_bins):
-            mask = (freqs >= log_edges[i]) & (freqs < log_edges[i + 1])
-            if np.any(mask):
-                bins[i] = np.mean(fft[mask])
-        
-        # Normalize: scale to roughly 0-1 range
-        # Use a fixed reference (from test: bass peaks ~90, treble ~3)
-        # Low bins get more energy, so use per-bin scaling
-        ref_scale = np.linspace(40.0, 3.0, self.num_bins)
-        bins = np.minimum(bins / ref_scale, 1.5)
+    def _publish(self, bass, mid, treble, new_bins):
+        """Smooth new values into the back buffer, then flip it to the front.
+        
+        new_bins=None means a silent frame: the spectrum only decays.
+        """
+        s = self.smooth_factor ** self._smooth_exp
+        ss = self.spectrum_smooth ** self._smooth_exp
+        front = self._front
+        back = 1 - front
+        levels = self._levels[back]
+        np.multiply(self._levels[front], s, out=levels)
+        levels[0] += bass * (1 - s)
+        levels[1] += mid * (1 - s)
+        levels[2] += treble * (1 - s)
+        spectrum = self._spectra[back]
+        np.multiply(self._spectra[front], ss, out=spectrum)
+        if new_bins is not None:
+            spectrum += new_bins * (1 - ss)
+        self._front = back
+
+    def _compute_spectrum_bins(self, bin_means):
+        """Normalize the 64 logarithmically-spaced spectrum bins."""
+        # Normalize: scale to roughly 0-1 range against the per-bin reference
+        bins = self._bins
+        np.divide(bin_means, self._ref_scale, out=bins, casting='same_kind')
+        np.minimum(bins, 1.5, out=bins)
         
         return bins
 
     def get_audio_levels(self):
-        with self.lock:
-            return self.bass, self.mid, self.treble
+        bass, mid, treble = self._levels[self._front].tolist()
+        return bass, mid, treble
     
-    def get_spectrum(self):
-        with self.lock:
-            return self.spectrum_bins.copy()
+    def get_spectrum(self, out=None):
+        """Return the latest published spectrum.
+        
+        If `out` is given the bins are copied into it and it is returned.
+        Otherwise the array is not copied: it stays valid until the capture
+        thread publishes two more frames, so use it right away.
+        """
+        spectrum = self._spectra[self._front]
+        if out is None:
+            return spectrum
+        np.copyto(out, spectrum)
+        return out
@@ -1,3 +1,4 @@
+import sys
 import pygame
 import moderngl
 import numpy as np
@@ -5,6 +6,32 @@ from pathlib import Path
 from src.utils import get_base_path
 from src.menu import Menu
 
+def _surface_swizzle(surface):
+    """Texture swizzle that reads a 32-bit surface's raw pixel bytes as RGBA."""
+    order = []
+    for shift in surface.get_shifts()[:3]:
+        byte = shift // 8
+        if sys.byteorder == 'big':
+            byte = 3 - byte
+        order.append('RGBA'[byte])
+    if surface.get_masks()[3]:
+        byte = surface.get_shifts()[3] // 8
+        if sys.byteorder == 'big':
+            byte = 3 - byte
+        order.append('RGBA'[byte])
+    else:
+        order.append('1')  # No alpha channel: the padding byte is undefined
+    return ''.join(order)
+
+# Menu keys packed into each effect uniform of visualizer.frag (for
+# fx_mask, key n is bit n)
+_EFFECT_UNIFORMS = (
+    ('fx_mask', ('fx_zoom', 'fx_ripple', 'fx_wave', 'fx_chromatic', 'fx_edge_glow',
+                 'fx_destellos', 'fx_bars', 'fx_circle', 'fx_colormask')),
+    ('src0', ('src_zoom', 'src_ripple', 'src_wave', 'src_chromatic')),
+    ('src1', ('src_edge_glow', 'src_destellos')),
+)
+
 class GraphicsEngine:
     def __init__(self, width=1280, height=720):
         self.width = width
@@ -24,20 +51,22 @@ class GraphicsEngine:
         self.borderless = False
         self.fullscreen = False
         
-        pygame.display.set_mode((self.width, self.height), pygame.OPENGL | pygame.DOUBLEBUF | pygame.RESIZABLE)
+        self._set_mode((self.width, self.height), pygame.OPENGL | pygame.DOUBLEBUF | pygame.RESIZABLE)
         pygame.display.set_caption("Audio Visualizer")
         self.clock = pygame.time.Clock()
         
         # ModernGL Context
         try:
             self.ctx = moderngl.create_context()
-            self.ctx.enable(moderngl.BLEND)
+            # Blending is only enabled around the overlay pass
             self.ctx.blend_func = (moderngl.SRC_ALPHA, moderngl.ONE_MINUS_SRC_ALPHA)
         except Exception as e:
             print(f"Graphics: ModernGL Init Failed: {e}", flush=True)
             raise
         
-        self.start_time = pygame.time.get_ticks() / 1000.0
+        # Shader time in ms, summed from clock.tick() (the one clock read per
+        # frame) instead of a separate get_ticks() call
+        self._elapsed_ms = 0
         
         # Main visualization shader
         self.prog = self._load_shader('basic.vert', 'visualizer.frag')
@@ -45,6 +74,30 @@ class GraphicsEngine:
         # Overlay shader (for menu)
         self.overlay_prog = self._load_shader('basic.vert', 'overlay.frag')
         
+        # Cached uniform handles (names the GLSL compiler optimized out are
+        # simply missing) and the last value written to each one
+        self._uniforms = {}
+        for name in ('tex', 'spectrum_tex',
+                     'fx_mask', 'src0', 'src1'):
+            uniform = self.prog.get(name, None)
+            if uniform is not None:
+                self._uniforms[name] = uniform
+        self._last_uniforms = {}
+        
+        # Texture units never change
+        self._set_uniform('tex', 0)
+        self._set_uniform('spectrum_tex', 1)
+        if self.overlay_prog.get('tex', None) is not None:
+            self.overlay_prog['tex'].value = 0
+        
+        # Per-frame values go through one uniform buffer (the Frame block in
+        # visualizer.frag, std140): resolution, uv_scale, uv_offset, time,
+        # bass, mid, treble, padded to 48 bytes
+        self._frame_data = np.zeros(12, dtype=np.float32)
+        self._frame_ubo = self.ctx.buffer(reserve=self._frame_data.nbytes, dynamic=True)
+        self.prog['Frame'].binding = 0
+        self._frame_ubo.bind_to_uniform_block(0)
+        
         # Quad Geometry
         vertices = np.array([
             -1.0, -1.0, 0.0, 1.0,
@@ -53,25 +106,47 @@ class GraphicsEngine:
              1.0,  1.0, 1.0, 0.0,
         ], dtype='f4')
 
-        self.vbo = self.ctx.buffer(vertices.tobytes())
+        self.vbo = self.ctx.buffer(vertices)
         self.vao = self.ctx.vertex_array(self.prog, [
             (self.vbo, '2f 2f', 'in_vert', 'in_uv'),
         ])
         self.overlay_vao = self.ctx.vertex_array(self.overlay_prog, [
             (self.vbo, '2f 2f', 'in_vert', 'in_uv'),
         ])
+        # Both always draw the quad as a strip: set the mode once and keep
+        # the bound render methods for the frame loop
+        self.vao.mode = moderngl.TRIANGLE_STRIP
+        self.overlay_vao.mode = moderngl.TRIANGLE_STRIP
+        self._draw_scene = self.vao.render
+        self._draw_overlay = self.overlay_vao.render
         
         # Textures
         self.texture = None
         self.overlay_texture = None
+        self._overlay_pbos = []
+        self._overlay_idx = 0
+        self._overlay_version = None  # Menu.render_count of the uploaded overlay
         self.original_surface = None
         
+        # Overlay texture is panel-sized and created on the first menu
+        # upload; later frames are written into it while the size holds
+        self._overlay_swizzle = _surface_swizzle(pygame.Surface((1, 1), pygame.SRCALPHA))
+        
         # Spectrum texture (64x1, single RED channel, float32)
         self.spectrum_texture = self.ctx.texture((64, 1), 1, dtype='f4')
         self.spectrum_texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
+        self._spec_scratch = np.empty(64, dtype=np.float32)
         
         # Menu
         self.menu = Menu()
+        self._menu_values = self.menu.get_values_snapshot()
+        
+        # Only these event types are let into the queue; the rest are
+        # dropped by pygame before they become Python objects
+        self._event_types = [pygame.QUIT, pygame.KEYDOWN, pygame.VIDEORESIZE]
+        self._event_types += [t for t in self.menu.relevant_events() if t not in self._event_types]
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(self._event_types)
         
         # Load images and connect menu
         self._image_list = []  # sorted list of Path objects
@@ -114,6 +189,15 @@ class GraphicsEngine:
             self.original_surface = self._create_fallback_surface()
             self._upload_texture_cover(self.original_surface)
 
+    def _set_uniform(self, name, value):
+        """Write a uniform of the main shader, skipping unchanged values."""
+        if self._last_uniforms.get(name) == value:
+            return
+        uniform = self._uniforms.get(name)
+        if uniform is not None:
+            uniform.value = value
+        self._last_uniforms[name] = value
+
     def _load_shader(self, vert_name, frag_name):
         vert_path = self.base_path / 'shaders' / vert_name
         frag_path = self.base_path / 'shaders' / frag_name
@@ -129,46 +213,97 @@ class GraphicsEngine:
         self._scan_and_load_images()
     
     def _upload_texture_cover(self, surface):
-        """Crop and scale image to fill window exactly (cover mode)."""
+        """Upload the image at native size; cover-fit is done in the shader.
+        
+        32-bit surfaces are uploaded straight from their pixel buffer (no
+        tostring copy) with a swizzle for their channel order; anything else
+        is first blitted onto a 32-bit surface. Images larger than needed to
+        cover the screen are shrunk once here: the window never shows more
+        pixels than that, and a smaller texture is cheaper to sample.
+        """
         iw, ih = surface.get_size()
+        shrink = max(max(self.screen_w, self.width) / iw, max(self.screen_h, self.height) / ih)
+        if shrink < 1.0:
+            iw = max(1, round(iw * shrink))
+            ih = max(1, round(ih * shrink))
+            surface = pygame.transform.smoothscale(surface, (iw, ih))
+        if surface.get_bytesize() != 4 or surface.get_pitch() != iw * 4:
+            converted = pygame.Surface((iw, ih), pygame.SRCALPHA)
+            converted.blit(surface, (0, 0))
+            surface = converted
+        if self.texture:
+            self.texture.release()
+        self.texture = self.ctx.texture((iw, ih), 4, surface.get_view('0'))
+        self.texture.swizzle = _surface_swizzle(surface)
+        # Cover-fit usually draws the image smaller than its native size:
+        # sample from mipmaps so the minified background doesn't alias
+        self.texture.build_mipmaps()
+        self.texture.filter = (moderngl.LINEAR_MIPMAP_LINEAR, moderngl.LINEAR)
+        self._update_cover_uv()
+
+    def _update_cover_uv(self):
+        """Compute the UV scale/offset that crops the image to fill the window (cover mode)."""
+        iw, ih = self.texture.size
         tw, th = self.width, self.height
         
         scale = max(tw / iw, th / ih)
-        scaled_w = int(iw * scale)
-        scaled_h = int(ih * scale)
-        
-        scaled = pygame.transform.smoothscale(surface, (scaled_w, scaled_h))
-        
-        crop_x = (scaled_w - tw) // 2
-        crop_y = (scaled_h - th) // 2
-        cropped = scaled.subsurface((crop_x, crop_y, tw, th))
-        
-        texture_data = pygame.image.tostring(cropped, 'RGBA')
-        if self.texture:
-            self.texture.release()
-        self.texture = self.ctx.texture((tw, th), 4, texture_data)
-        self.texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        sx = tw / (iw * scale)
+        sy = th / (ih * scale)
+        self.uv_scale = (sx, sy)
+        self.uv_offset = ((1.0 - sx) * 0.5, (1.0 - sy) * 0.5)
 
-    def _upload_overlay(self, surface):
-        """Upload a Pygame RGBA surface as the overlay texture."""
-        w, h = surface.get_size()
-        texture_data = pygame.image.tostring(surface, 'RGBA')
+    def _create_overlay_texture(self, size):
+        """(Re)allocate the overlay texture and its upload buffers (called
+        when the menu panel size changes)."""
         if self.overlay_texture:
             self.overlay_texture.release()
-        self.overlay_texture = self.ctx.texture((w, h), 4, texture_data)
+        for pbo in self._overlay_pbos:
+            pbo.release()
+        self.overlay_texture = self.ctx.texture(size, 4)
+        self.overlay_texture.swizzle = self._overlay_swizzle
         self.overlay_texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        self._overlay_version = None  # New texture is empty: force an upload
+        # Ring of 3 pixel buffers: the driver can still be copying from the
+        # previous one while the next frame is written into another
+        self._overlay_pbos = [self.ctx.buffer(reserve=size[0] * size[1] * 4, dynamic=True)
+                              for _ in range(3)]
+        self._overlay_idx = 0
+
+    def _upload_overlay(self, surface):
+        """Upload a Pygame RGBA surface into the overlay texture.
+        
+        The surface's pixel buffer is handed to the GPU as-is (no tostring
+        copy); the texture swizzle maps its channel order back to RGBA.
+        Pixels go through a pixel buffer so the texture update is async.
+        """
+        if self.overlay_texture is None or surface.get_size() != self.overlay_texture.size:
+            self._create_overlay_texture(surface.get_size())
+        pbo = self._overlay_pbos[self._overlay_idx]
+        pbo.write(surface.get_view('0'))
+        self.overlay_texture.write(pbo)
+        self._overlay_idx = (self._overlay_idx + 1) % len(self._overlay_pbos)
 
     def _create_fallback_surface(self):
         w, h = 1280, 720
-        surface = pygame.Surface((w, h))
-        surface.fill((20, 20, 20))
         color = (100, 255, 100)
         gap = 40
-        for x in range(0, w, gap):
-            pygame.draw.line(surface, color, (x, 0), (x, h), 1)
-        for y in range(0, h, gap):
-            pygame.draw.line(surface, color, (0, y), (w, y), 1)
-        return surface
+        # Built as one array (surfarray layout is [x, y, rgb]) instead of
+        # drawing each grid line
+        pixels = np.full((w, h, 3), 20, dtype=np.uint8)
+        pixels[::gap, :] = color
+        pixels[:, ::gap] = color
+        return pygame.surfarray.make_surface(pixels)
+
+    def _set_mode(self, size, flags):
+        """Open the window with vsync, so flip() paces the frames instead of
+        a sleep in clock.tick. If the driver can't enable it, keep the 60 FPS
+        software cap so the loop never runs unbounded."""
+        try:
+            pygame.display.set_mode(size, flags, vsync=1)
+            self._fps_cap = 0
+        except pygame.error:
+            pygame.display.set_mode(size, flags)
+            self._fps_cap = 60
 
     def _set_window_pos(self, x, y):
         """Force window position using Windows API."""
@@ -196,7 +331,7 @@ class GraphicsEngine:
             # os.environ['SDL_VIDEO_WINDOW_POS'] = '0,0' # Not reliable dynamically
             self.width, self.height = self.screen_w, self.screen_h
             flags = pygame.OPENGL | pygame.DOUBLEBUF | pygame.NOFRAME
-            pygame.display.set_mode((self.width, self.height), flags)
+            self._set_mode((self.width, self.height), flags)
             
             # Force move to 0,0
             self._set_window_pos(0, 0)
@@ -208,14 +343,13 @@ class GraphicsEngine:
             flags = pygame.OPENGL | pygame.DOUBLEBUF | pygame.RESIZABLE
             if self.borderless:
                 flags |= pygame.NOFRAME
-            pygame.display.set_mode((self.width, self.height), flags)
+            self._set_mode((self.width, self.height), flags)
             
             # Recenter (optional, or let OS decide)
             # self._set_window_pos(100, 100)
         
         self.ctx.viewport = (0, 0, self.width, self.height)
-        if self.original_surface:
-            self._upload_texture_cover(self.original_surface)
+        self._update_cover_uv()
 
     def _toggle_borderless(self):
         if self.fullscreen:
@@ -224,11 +358,41 @@ class GraphicsEngine:
         flags = pygame.OPENGL | pygame.DOUBLEBUF | pygame.RESIZABLE
         if self.borderless:
             flags |= pygame.NOFRAME
-        pygame.display.set_mode((self.width, self.height), flags)
+        self._set_mode((self.width, self.height), flags)
 
-    def render(self, bass, mid, treble, spectrum=None):
-        # Handle events
-        for event in pygame.event.get():
+    def _push_effect_uniforms(self, values, changed):
+        """Write the packed effect toggle/source uniforms that contain a changed key."""
+        for name, keys in _EFFECT_UNIFORMS:
+            if changed.isdisjoint(keys):
+                continue
+            if name == 'fx_mask':
+                self._set_uniform(name, sum(1 << bit for bit, key in enumerate(keys)
+                                            if values[key] > 0.5))
+            else:
+                self._set_uniform(name, tuple(int(values[key]) for key in keys))
+
+    def _handle_events(self):
+        """Drain the event queue once and dispatch it. Returns False on quit."""
+        # The queue only holds the types we use (see __init__), so a plain
+        # get() returns them in the order they happened. get() with a type
+        # list would group them by type instead.
+        events = pygame.event.get()
+        
+        # A run of mouse motions collapses into its last event, carrying the
+        # run's summed rel: hover and slider drags only need the final
+        # position. Motions before and after a button or key event stay
+        # apart, so a click still sees the position it happened at.
+        motion = pygame.MOUSEMOTION
+        coalesced = []
+        for event in events:
+            if event.type == motion and coalesced and coalesced[-1].type == motion:
+                dx, dy = coalesced[-1].rel
+                event.rel = (event.rel[0] + dx, event.rel[1] + dy)
+                coalesced[-1] = event
+            else:
+                coalesced.append(event)
+        
+        for event in coalesced:
             if event.type == pygame.QUIT:
                 return False
             
@@ -247,74 +411,81 @@ class GraphicsEngine:
             if event.type == pygame.VIDEORESIZE:
                 self.width, self.height = event.size
                 self.ctx.viewport = (0, 0, self.width, self.height)
-                if self.original_surface:
-                    self._upload_texture_cover(self.original_surface)
+                self._update_cover_uv()
+        return True
+
+    def render(self, bass, mid, treble, spectrum=None):
+        # Input first, so the frame below reflects it
+        if not self._handle_events():
+            return False
 
+        # Menu values are re-read only after the menu reports a change
+        changed = self.menu.pop_changed_keys()
+        if changed:
+            self._menu_values = self.menu.get_values_snapshot()
+        values = self._menu_values
+        
         # Apply menu multipliers
-        sensitivity = self.menu.get_value("sensitivity")
-        adj_bass = bass * sensitivity * self.menu.get_value("bass_intensity")
-        adj_mid = mid * sensitivity * self.menu.get_value("mid_intensity")
-        adj_treble = treble * sensitivity * self.menu.get_value("treble_intensity")
+        sensitivity = values["sensitivity"]
+        adj_bass = bass * sensitivity * values["bass_intensity"]
+        adj_mid = mid * sensitivity * values["mid_intensity"]
+        adj_treble = treble * sensitivity * values["treble_intensity"]
 
-        # Update spectrum texture
+        # Update spectrum texture (computed in float32 even if the caller
+        # passes float64 bins, so no wider temporary is made)
         if spectrum is not None:
-            spec_data = (spectrum * sensitivity).astype(np.float32)
-            self.spectrum_texture.write(spec_data.tobytes())
+            np.multiply(spectrum, sensitivity, out=self._spec_scratch, dtype=np.float32)
+            self.spectrum_texture.write(self._spec_scratch)
 
         # Clear
         self.ctx.clear(0.0, 0.0, 0.0)
         
-        # Set uniforms
-        current_time = pygame.time.get_ticks() / 1000.0 - self.start_time
+        # Per-frame uniforms, in Frame block order
+        current_time = self._elapsed_ms * 0.001
         
-        try:
-            self.prog['time'].value = current_time
-            self.prog['resolution'].value = (float(self.width), float(self.height))
-            self.prog['bass'].value = float(adj_bass)
-            self.prog['mid'].value = float(adj_mid)
-            self.prog['treble'].value = float(adj_treble)
-            self.prog['tex'].value = 0
-            self.prog['spectrum_tex'].value = 1
-            
-            # Effect toggles from menu
-            self.prog['fx_zoom'].value = 1.0 if self.menu.get_value("fx_zoom") > 0.5 else 0.0
-            self.prog['fx_ripple'].value = 1.0 if self.menu.get_value("fx_ripple") > 0.5 else 0.0
-            self.prog['fx_wave'].value = 1.0 if self.menu.get_value("fx_wave") > 0.5 else 0.0
-            self.prog['fx_chromatic'].value = 1.0 if self.menu.get_value("fx_chromatic") > 0.5 else 0.0
-            self.prog['fx_edge_glow'].value = 1.0 if self.menu.get_value("fx_edge_glow") > 0.5 else 0.0
-            self.prog['fx_destellos'].value = 1.0 if self.menu.get_value("fx_destellos") > 0.5 else 0.0
-            
-            self.prog['fx_bars'].value = 1.0 if self.menu.get_value("fx_bars") > 0.5 else 0.0
-            self.prog['fx_circle'].value = 1.0 if self.menu.get_value("fx_circle") > 0.5 else 0.0
-            self.prog['fx_colormask'].value = 1.0 if self.menu.get_value("fx_colormask") > 0.5 else 0.0
-            
-            # Source Selectors
-            self.prog['src_zoom'].value = int(self.menu.get_value("src_zoom"))
-            self.prog['src_ripple'].value = int(self.menu.get_value("src_ripple"))
-            self.prog['src_wave'].value = int(self.menu.get_value("src_wave"))
-            self.prog['src_chromatic'].value = int(self.menu.get_value("src_chromatic"))
-            self.prog['src_edge_glow'].value = int(self.menu.get_value("src_edge_glow"))
-            self.prog['src_destellos'].value = int(self.menu.get_value("src_destellos"))
-        except Exception:
-            pass
+        frame = self._frame_data
+        frame[0] = self.width
+        frame[1] = self.height
+        frame[2:4] = self.uv_scale
+        frame[4:6] = self.uv_offset
+        frame[6] = current_time
+        frame[7] = adj_bass
+        frame[8] = adj_mid
+        frame[9] = adj_treble
+        self._frame_ubo.write(frame)
+        
+        # Effect toggles and sources, only those touched by a menu change
+        if changed:
+            self._push_effect_uniforms(values, changed)
 
         # Bind textures and render
         self.texture.use(0)
         self.spectrum_texture.use(1)
-        self.vao.render(moderngl.TRIANGLE_STRIP)
+        # The scene pass writes every pixel with alpha 1, so it runs without
+        # blending (no framebuffer read per fragment). The menu panel is
+        # translucent, so nothing behind it can be skipped.
+        self._draw_scene()
         
         # Menu overlay
-        if self.menu.visible:
-            menu_surface = self.menu.render_surface(self.width, self.height)
-            self._upload_overlay(menu_surface)
+        menu = self.menu.render_surface(self.width, self.height)
+        if menu is not None:
+            menu_surface, (mx, my) = menu
+            # Upload only after the menu actually redrew; otherwise the
+            # texture from a previous frame is still valid
+            if self._overlay_version != self.menu.render_count:
+                self._upload_overlay(menu_surface)
+                self._overlay_version = self.menu.render_count
             self.overlay_texture.use(0)
-            try:
-                self.overlay_prog['tex'].value = 0
-            except Exception:
-                pass
-            self.overlay_vao.render(moderngl.TRIANGLE_STRIP)
+            # Draw the quad over the panel's rect only (GL's origin is the
+            # bottom-left corner), so blending touches just those pixels
+            mw, mh = menu_surface.get_size()
+            self.ctx.viewport = (mx, self.height - my - mh, mw, mh)
+            self.ctx.enable(moderngl.BLEND)
+            self._draw_overlay()
+            self.ctx.disable(moderngl.BLEND)
+            self.ctx.viewport = (0, 0, self.width, self.height)
         
         pygame.display.flip()
-        self.clock.tick(60)
+        self._elapsed_ms += self.clock.tick(self._fps_cap)
         
         return True
@@ -3,9 +3,38 @@ Menu overlay for the Audio Visualizer.
 Renders a semi-transparent settings panel with mouse + keyboard support.
 Supports scrollable sections for effect groups.
 """
+import bisect
 import pygame
 from pathlib import Path
 
+# Key hints shown at the bottom of the panel
+HINTS = (
+    "[←/→] Navegar Fondo   [Click/S] Fuente",
+    "[F] Pantalla Comp.  [B] Sin bordes",
+)
+
+# (name, size, bold) -> Font, for the current font module session
+_fonts = {}
+
+def _sys_font(name, size, bold=False):
+    """SysFont lookup, shared by every Menu (font lookup and TTF loading
+    are slow, and Font objects can be reused freely).
+    
+    Fonts die with the font module: the cache is dropped on pygame.quit()
+    (a quit hook runs only once, so it is registered again each time the
+    cache is refilled) and whenever the font module is found shut down.
+    """
+    if not pygame.font.get_init():
+        _fonts.clear()
+        pygame.font.init()
+    key = (name, size, bold)
+    font = _fonts.get(key)
+    if font is None:
+        if not _fonts:
+            pygame.register_quit(_fonts.clear)
+        font = _fonts[key] = pygame.font.SysFont(name, size, bold=bold)
+    return font
+
 class Menu:
     def __init__(self):
         self.visible = False
@@ -58,44 +87,166 @@ class Menu:
             {"label": "Sensibilidad",      "key": "sensitivity",      "type": "slider", "min": 0.1, "max": 3.0, "step": 0.1, "value": 1.0, "group": None},
         ]
         
-        # Fonts
-        pygame.font.init()
-        self.font_title = pygame.font.SysFont("Segoe UI", 22, bold=True)
-        self.font_item = pygame.font.SysFont("Segoe UI", 17)
-        self.font_hint = pygame.font.SysFont("Segoe UI", 13)
-        self.font_small = pygame.font.SysFont("Segoe UI", 12, bold=True)
-        self.font_arrow = pygame.font.SysFont("Segoe UI", 14, bold=True)
+        # Static per-item metadata as parallel tuples (types and groups never
+        # change), so scans index a tuple instead of hashing into each dict.
+        # Values stay in the item dicts, which the input handlers mutate.
+        self._types = tuple(item["type"] for item in self.items)
+        self._groups = tuple(item.get("group") for item in self.items)
         
-        # Colors
-        self.bg_color = (12, 12, 22, 230)
+        # Key (or src_key) -> (item, field holding its value), so get_value
+        # is one lookup; the item dicts are shared, so values stay live
+        self._key_index = {}
+        for item in self.items:
+            self._key_index[item["key"]] = (item, "value")
+            if "src_key" in item:
+                self._key_index[item["src_key"]] = (item, "src_value")
+        
+        # Group membership never changes: {group: [global index, ...]} and
+        # {global index: position within its group}
+        self._group_index = {}
+        self._item_pos_in_group = {}
+        for i, group in enumerate(self._groups):
+            if group:
+                members = self._group_index.setdefault(group, [])
+                self._item_pos_in_group[i] = len(members)
+                members.append(i)
+        
+        # Drawing order, resolved once: ("separator", i), ("item", i), or
+        # ("group", name) in place of a scrollable group's whole run
+        self._layout = []
+        for i, (itype, group) in enumerate(zip(self._types, self._groups)):
+            if itype == "separator":
+                self._layout.append(("separator", i))
+            elif group in self._group_max_visible:
+                if ("group", group) not in self._layout:
+                    self._layout.append(("group", group))
+            else:
+                self._layout.append(("item", i))
+        self._layout = tuple(self._layout)
+        
+        # Slider ranges in whole steps: {index: (lo, hi, steps per unit)}.
+        # Values are set as n / steps, which is exact to the nearest float
+        # (what round(..., 2) produced), so the step math stays in ints.
+        self._slider_steps = {}
+        for i, item in enumerate(self.items):
+            if item["type"] == "slider":
+                per_unit = round(1 / item["step"])
+                self._slider_steps[i] = (round(item["min"] * per_unit),
+                                         round(item["max"] * per_unit), per_unit)
+        
+        # Keys whose value changed since the renderer last asked; all of
+        # them at start, so the first frame pushes every value
+        self._changed_keys = set(self.get_values_snapshot())
+        
+        # Keyboard navigation order: every non-separator item, then the ones
+        # currently scrolled into view with their rank (rebuilt on scroll)
+        self._selectable_all = tuple(i for i, itype in enumerate(self._types) if itype != "separator")
+        self._selectable = None
+        self._selectable_rank = {}
+        
+        # Menu keys -> handler(event, selectable); other keys aren't consumed
+        self._key_handlers = {
+            pygame.K_UP: self._kbd_up,
+            pygame.K_DOWN: self._kbd_down,
+            pygame.K_LEFT: self._kbd_horiz,
+            pygame.K_RIGHT: self._kbd_horiz,
+            pygame.K_s: self._kbd_source,
+            pygame.K_RETURN: self._kbd_activate,
+            pygame.K_SPACE: self._kbd_activate,
+        }
+        
+        # Fonts. Loaded here rather than on first open: the static text is
+        # pre-rendered below so opening the menu doesn't stall a frame.
+        self.font_title = _sys_font("Segoe UI", 22, bold=True)
+        self.font_item = _sys_font("Segoe UI", 17)
+        self.font_hint = _sys_font("Segoe UI", 13)
+        self.font_small = _sys_font("Segoe UI", 12, bold=True)
+        self.font_arrow = _sys_font("Segoe UI", 14, bold=True)
+        
+        # Colors. Text colors stay tuples (they are part of the text cache
+        # key and pygame.Color isn't hashable); colors only passed to
+        # pygame.draw are built as pygame.Color once, so draw calls don't
+        # convert a tuple each time.
+        self.bg_color = pygame.Color(12, 12, 22, 230)
+        self.border_color = pygame.Color(100, 80, 180, 100)
+        self.line_color = pygame.Color(80, 60, 140, 120)
         self.title_color = (180, 140, 255)
         self.text_color = (200, 200, 220)
         self.selected_color = (100, 220, 255)
         self.hover_color = (80, 180, 220)
+        self.highlight_selected = pygame.Color(40, 60, 100, 70)
+        self.highlight_hovered = pygame.Color(40, 60, 100, 30)
+        
+        self.bar_bg = pygame.Color(40, 40, 60)
+        self.bar_fill = pygame.Color(80, 160, 255)
+        self.bar_fill_selected = pygame.Color(100, 220, 255)
+        self.slider_knob_color = pygame.Color(220, 220, 255)
         
-        self.bar_bg = (40, 40, 60)
-        self.bar_fill = (80, 160, 255)
-        self.bar_fill_selected = (100, 220, 255)
+        self.toggle_on = pygame.Color(80, 220, 140)
+        self.toggle_off = pygame.Color(120, 60, 60)
+        self.toggle_knob_color = pygame.Color(255, 255, 255, 230)
         
-        self.toggle_on = (80, 220, 140)
-        self.toggle_off = (120, 60, 60)
+        self.button_color = pygame.Color(60, 60, 100)
+        self.button_border_color = pygame.Color(100, 80, 180, 160)
+        self.button_text_color = (200, 200, 240)
+        self.image_name_color = (160, 180, 220)
         
         # Source colors: Bass=Red, Mid=Green, Treble=Blue
         self.src_colors = [
-            (255, 80, 80),   # Bass
-            (80, 255, 100),  # Mid
-            (80, 160, 255)   # Treble
+            pygame.Color(255, 80, 80),   # Bass
+            pygame.Color(80, 255, 100),  # Mid
+            pygame.Color(80, 160, 255)   # Treble
         ]
         self.src_labels = ["BASS", "MID", "TREB"]
+        self.src_text_color = (20, 20, 30)
         
         self.hint_color = (110, 110, 140)
-        self.separator_color = (60, 50, 100, 120)
+        self.separator_color = pygame.Color(60, 50, 100, 120)
         self.arrow_color = (140, 120, 200)
         self.arrow_hover_color = (180, 160, 255)
         
+        # Rendered text surfaces: {(font id, text, color): Surface}, FIFO-bounded
+        self._text_cache = {}
+        self._text_cache_size = 256
+        # Pixel format of the overlay surfaces (what every cached piece is
+        # blitted onto). The overlay is uploaded to GL, never blitted to the
+        # display, so this, not the display format, is the one to match.
+        self._blit_masks = pygame.Surface((1, 1), pygame.SRCALPHA).get_masks()
+        
+        # Every label is drawn in one of three colors: render those up front
+        for item in self.items:
+            if item["type"] != "separator":
+                for color in (self.text_color, self.selected_color, self.hover_color):
+                    self._text(self.font_item, item["label"], color)
+        
+        # Text that never changes: title, hints and scroll arrows
+        self._title_surf = self._text(self.font_title, "⚙  EFECTOS & AJUSTES", self.title_color)
+        self._hint_surfs = [self._text(self.font_hint, t, self.hint_color) for t in HINTS]
+        self._arrow_up_surf = self._text(self.font_arrow, "▲  ▲  ▲", self.arrow_color)
+        self._arrow_down_surf = self._text(self.font_arrow, "▼  ▼  ▼", self.arrow_color)
+        
+        # Pre-rendered opaque rounded rects: {(w, h, radius, rgba): Surface}.
+        # The fixed-size ones are built up front; bar sizes fill in lazily.
+        self._rrect_cache = {}
+        self._rrect(56, 24, 5, self.button_color)  # Image selector buttons
+        # The row highlights and button borders are translucent, so they
+        # stay pygame.draw calls (see _rrect)
+        
+        # Complete toggle switches (body + knob) and source buttons (body +
+        # label): fixed size and only a few states, so each is one blit
+        self._toggle_surf_on = self._render_toggle(True)
+        self._toggle_surf_off = self._render_toggle(False)
+        self._src_button_surfs = [self._render_src_button(v) for v in range(len(self.src_colors))]
+        
+        # Static panel layer (background, title, hints), rebuilt only when
+        # the panel size changes
+        self._panel_base = None
+        self._panel_buf = None  # Reused draw target for render_surface
+        
         # Layout cache (updated each render)
         self._panel_rect = None
-        self._item_rects = []  # [(index, pygame.Rect, type)]
+        self._item_rects = []  # [(index, pygame.Rect, type)], top to bottom
+        self._row_tops = []  # Rect.y of each _item_rects entry, for bisect
         self._slider_bar_rects = {}  # {index: pygame.Rect}
         self._toggle_rects = {}  # {index: pygame.Rect}
         self._src_rects = {} # {index: pygame.Rect}
@@ -109,80 +260,125 @@ class Menu:
         # Mouse state
         self.hovered = -1
         self.dragging_slider = -1
+        self._last_mouse_pos = None  # From the latest mouse event; None = not seen yet
+        
+        # Set whenever something visible changes. render_surface() only
+        # redraws when it is set (or the size changed) and otherwise returns
+        # the cached surface; render_count tells callers a redraw happened.
+        self.dirty = True
+        self._cached_surface = None  # (surface, pos) from the last redraw
+        self._cached_screen = None   # Screen size it was laid out for
+        self.render_count = 0
     
     # ── Scroll helpers ─────────────────────────────────────
     
     def _get_group_items(self, group_name):
         """Return list of (global_index, item) for a given group."""
-        return [(i, item) for i, item in enumerate(self.items) if item.get("group") == group_name]
+        return [(gi, self.items[gi]) for gi in self._group_index.get(group_name, ())]
     
     def _scroll_group(self, group_name, delta):
         """Scroll a group by delta. Clamps to valid range."""
         if group_name not in self._group_max_visible:
             return
-        group_items = self._get_group_items(group_name)
         max_vis = self._group_max_visible[group_name]
-        total = len(group_items)
+        total = len(self._group_index.get(group_name, ()))
         if total <= max_vis:
             return  # No scrolling needed
         max_offset = total - max_vis
         self._scroll_offsets[group_name] = max(0, min(max_offset, self._scroll_offsets[group_name] + delta))
+        self._selectable = None
+        self.dirty = True
     
     def _ensure_selected_visible(self):
         """If the selected item is in a scrollable group, adjust scroll so it's visible."""
         if self.selected < 0 or self.selected >= len(self.items):
             return
-        item = self.items[self.selected]
-        group = item.get("group")
+        group = self._groups[self.selected]
         if not group or group not in self._group_max_visible:
             return
         
-        group_items = self._get_group_items(group)
         max_vis = self._group_max_visible[group]
-        # Find position of selected within group
-        group_pos = None
-        for pos, (gi, _) in enumerate(group_items):
-            if gi == self.selected:
-                group_pos = pos
-                break
-        if group_pos is None:
-            return
+        group_pos = self._item_pos_in_group[self.selected]
         
         offset = self._scroll_offsets[group]
         if group_pos < offset:
             self._scroll_offsets[group] = group_pos
+            self._selectable = None
         elif group_pos >= offset + max_vis:
             self._scroll_offsets[group] = group_pos - max_vis + 1
+            self._selectable = None
     
     def _is_item_visible(self, index):
         """Check if an item is currently visible (not scrolled out)."""
-        item = self.items[index]
-        group = item.get("group")
+        group = self._groups[index]
         if not group or group not in self._group_max_visible:
             return True  # Non-grouped items are always visible
         
-        group_items = self._get_group_items(group)
         max_vis = self._group_max_visible[group]
-        if len(group_items) <= max_vis:
+        if len(self._group_index[group]) <= max_vis:
             return True  # Group fits, all visible
         
         offset = self._scroll_offsets[group]
-        group_pos = None
-        for pos, (gi, _) in enumerate(group_items):
-            if gi == index:
-                group_pos = pos
-                break
-        if group_pos is None:
-            return True
-        
+        group_pos = self._item_pos_in_group[index]
         return offset <= group_pos < offset + max_vis
     
+    def _text(self, font, text, color):
+        """font.render() with a cache, so unchanged text isn't rasterized again."""
+        key = (id(font), text, color)
+        surf = self._text_cache.get(key)
+        if surf is None:
+            surf = font.render(text, True, color)
+            if surf.get_masks() != self._blit_masks:
+                # Store it in the overlay's format so blits take the
+                # same-format path (a blit onto a transparent surface copies)
+                converted = pygame.Surface(surf.get_size(), pygame.SRCALPHA)
+                converted.blit(surf, (0, 0))
+                surf = converted
+            if len(self._text_cache) >= self._text_cache_size:
+                # Dicts keep insertion order: drop the oldest entry
+                del self._text_cache[next(iter(self._text_cache))]
+            self._text_cache[key] = surf
+        return surf
+    
+    def _rrect(self, w, h, radius, color):
+        """Rounded rect surface, cached; same pixels as pygame.draw.rect.
+        
+        Only for opaque colors: blitting blends, while draw.rect writes a
+        translucent color's alpha straight into the target.
+        """
+        key = (w, h, radius, tuple(color))
+        surf = self._rrect_cache.get(key)
+        if surf is None:
+            # Layout widths go negative in tiny windows: draw nothing then
+            surf = pygame.Surface((max(w, 0), max(h, 0)), pygame.SRCALPHA)
+            pygame.draw.rect(surf, color, surf.get_rect(), border_radius=radius)
+            self._rrect_cache[key] = surf
+        return surf
+    
+    def _render_toggle(self, is_on):
+        """40x20 toggle switch with its knob, fully opaque."""
+        surf = self._rrect(40, 20, 10, self.toggle_on if is_on else self.toggle_off).copy()
+        knob = pygame.Surface((16, 16), pygame.SRCALPHA)
+        pygame.draw.rect(knob, self.toggle_knob_color, knob.get_rect(), border_radius=8)
+        # Blended over the body (not written raw), so the knob doesn't let
+        # the scene show through the panel
+        surf.blit(knob, (22 if is_on else 2, 2))
+        return surf
+    
+    def _render_src_button(self, src_val):
+        """40x20 audio source button with its label."""
+        surf = self._rrect(40, 20, 4, self.src_colors[src_val]).copy()
+        txt = self._text(self.font_small, self.src_labels[src_val], self.src_text_color)
+        surf.blit(txt, ((40 - txt.get_width()) // 2, (20 - txt.get_height()) // 2))
+        return surf
+    
     # ── Image Selector API ──────────────────────────────────
     
     def set_image_list(self, image_paths, current_index=0):
         """Called by GraphicsEngine to populate the image list."""
         self._image_files = list(image_paths)
         self._image_index = max(0, min(current_index, len(self._image_files) - 1))
+        self.dirty = True
     
     def set_on_image_change(self, callback):
         """Register callback fn(path) called when user changes image."""
@@ -193,6 +389,7 @@ class Menu:
         if not self._image_files:
             return
         self._image_index = (self._image_index + delta) % len(self._image_files)
+        self.dirty = True
         if self._on_image_change:
             self._on_image_change(self._image_files[self._image_index])
     
@@ -205,28 +402,90 @@ class Menu:
     def toggle(self):
         self.visible = not self.visible
         self.dragging_slider = -1
+        self.dirty = True
     
     def get_value(self, key):
+        entry = self._key_index.get(key)
+        if entry is None:
+            return 1.0
+        item, field = entry
+        return item.get(field, 1.0)
+    
+    def get_values_snapshot(self):
+        """Return every value (including effect sources) as a plain {key: value} dict."""
+        values = {}
         for item in self.items:
-            if item["key"] == key:
-                return item["value"]
-            if "src_key" in item and item["src_key"] == key:
-                return item["src_value"]
-        return 1.0
+            if "value" in item:
+                values[item["key"]] = item["value"]
+            if "src_key" in item:
+                values[item["src_key"]] = item["src_value"]
+        return values
+    
+    def pop_changed_keys(self):
+        """Return the keys (and src_keys) changed since the last call, and reset."""
+        changed = self._changed_keys
+        self._changed_keys = set()
+        return changed
     
     def _get_selectable_items(self):
         """Return indices of selectable items that are currently visible."""
-        result = []
-        for i, item in enumerate(self.items):
-            if item["type"] == "separator":
-                continue
-            if not self._is_item_visible(i):
-                continue
-            result.append(i)
-        return result
+        if self._selectable is None:
+            self._selectable = [i for i in self._selectable_all if self._is_item_visible(i)]
+            self._selectable_rank = {idx: rank for rank, idx in enumerate(self._selectable)}
+        return self._selectable
+    
+    def relevant_events(self):
+        """Event types handle_input() reacts to."""
+        return [pygame.KEYDOWN, pygame.MOUSEWHEEL, pygame.MOUSEMOTION,
+                pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP]
+    
+    # ── Keyboard handlers (see _key_handlers) ──────────────
+    
+    def _kbd_up(self, event, selectable):
+        rank = self._selectable_rank.get(self.selected, 0)
+        self.selected = selectable[(rank - 1) % len(selectable)]
+        self._ensure_selected_visible()
+    
+    def _kbd_down(self, event, selectable):
+        rank = self._selectable_rank.get(self.selected, 0)
+        self.selected = selectable[(rank + 1) % len(selectable)]
+        self._ensure_selected_visible()
+    
+    def _kbd_horiz(self, event, selectable):
+        """←/→: flip a toggle, step a slider or change the background."""
+        item = self.items[self.selected]
+        itype = self._types[self.selected]
+        direction = 1 if event.key == pygame.K_RIGHT else -1
+        if itype in ("toggle", "effect_row"):
+            item["value"] = 0.0 if item["value"] > 0.5 else 1.0
+            self._changed_keys.add(item["key"])
+        elif itype == "slider":
+            lo, hi, per_unit = self._slider_steps[self.selected]
+            n = round(item["value"] * per_unit) + direction
+            item["value"] = max(lo, min(hi, n)) / per_unit
+            self._changed_keys.add(item["key"])
+        elif itype == "image_selector":
+            self._change_image(direction)
+    
+    def _kbd_source(self, event, selectable):
+        item = self.items[self.selected]
+        if self._types[self.selected] == "effect_row":
+            item["src_value"] = (item["src_value"] + 1) % 3
+            self._changed_keys.add(item["src_key"])
+    
+    def _kbd_activate(self, event, selectable):
+        item = self.items[self.selected]
+        if self._types[self.selected] in ("toggle", "effect_row"):
+            item["value"] = 0.0 if item["value"] > 0.5 else 1.0
+            self._changed_keys.add(item["key"])
     
     def handle_input(self, event):
         """Handle keyboard and mouse input. Returns True if event was consumed."""
+        # Track the pointer from events (even while hidden), so the wheel
+        # doesn't have to query SDL for it
+        if event.type in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+            self._last_mouse_pos = event.pos
+        
         # TAB toggle always works
         if event.type == pygame.KEYDOWN and event.key == pygame.K_TAB:
             self.toggle()
@@ -239,45 +498,18 @@ class Menu:
         if event.type == pygame.KEYDOWN:
             selectable = self._get_selectable_items()
             if not selectable: return False
-            
-            current_sel_idx = 0
-            if self.selected in selectable:
-                current_sel_idx = selectable.index(self.selected)
-            
-            if event.key == pygame.K_UP:
-                current_sel_idx = (current_sel_idx - 1) % len(selectable)
-                self.selected = selectable[current_sel_idx]
-                self._ensure_selected_visible()
-                return True
-            elif event.key == pygame.K_DOWN:
-                current_sel_idx = (current_sel_idx + 1) % len(selectable)
-                self.selected = selectable[current_sel_idx]
-                self._ensure_selected_visible()
-                return True
-            elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
-                item = self.items[self.selected]
-                if item["type"] in ("toggle", "effect_row"):
-                    item["value"] = 0.0 if item["value"] > 0.5 else 1.0
-                elif item["type"] == "slider":
-                    delta = item["step"] if event.key == pygame.K_RIGHT else -item["step"]
-                    item["value"] = max(item["min"], min(item["max"], round(item["value"] + delta, 2)))
-                elif item["type"] == "image_selector":
-                    self._change_image(1 if event.key == pygame.K_RIGHT else -1)
-                return True
-            elif event.key == pygame.K_s:
-                item = self.items[self.selected]
-                if item["type"] == "effect_row":
-                    item["src_value"] = (item["src_value"] + 1) % 3
-                return True
-            elif event.key in (pygame.K_RETURN, pygame.K_SPACE):
-                item = self.items[self.selected]
-                if item["type"] in ("toggle", "effect_row"):
-                    item["value"] = 0.0 if item["value"] > 0.5 else 1.0
-                return True
+            handler = self._key_handlers.get(event.key)
+            if handler is None:
+                return False
+            self.dirty = True
+            handler(event, selectable)
+            return True
         
         # --- Mouse Wheel (scroll groups) ---
         if event.type == pygame.MOUSEWHEEL:
-            mx, my = pygame.mouse.get_pos()
+            if self._last_mouse_pos is None:
+                self._last_mouse_pos = pygame.mouse.get_pos()
+            mx, my = self._last_mouse_pos
             for group_name, area_rect in self._group_area_rects.items():
                 if area_rect.collidepoint(mx, my):
                     self._scroll_group(group_name, -event.y)  # wheel up = -1 = scroll up
@@ -287,12 +519,10 @@ class Menu:
         # --- Mouse ---
         if event.type == pygame.MOUSEMOTION:
             mx, my = event.pos
-            self.hovered = -1
-            
-            for idx, rect, itype in self._item_rects:
-                if rect.collidepoint(mx, my):
-                    self.hovered = idx
-                    break
+            prev_hovered = self.hovered
+            self.hovered = self._row_at(mx, my)
+            if self.hovered != prev_hovered:
+                self.dirty = True
             
             # Drag slider
             if self.dragging_slider >= 0 and self.dragging_slider in self._slider_bar_rects:
@@ -304,54 +534,32 @@ class Menu:
             
             if self._panel_rect and not self._panel_rect.collidepoint(mx, my):
                 return False
+            self.dirty = True
             
-            # 0. Scroll arrows
-            for group_name, arrows in self._scroll_arrow_rects.items():
-                if "up" in arrows and arrows["up"].collidepoint(mx, my):
-                    self._scroll_group(group_name, -1)
-                    return True
-                if "down" in arrows and arrows["down"].collidepoint(mx, my):
-                    self._scroll_group(group_name, 1)
-                    return True
+            hit = self._hit_test(mx, my)
+            if hit is None:
+                return True
+            kind, target = hit
             
-            # 1. Image Selector Buttons
-            if self._img_prev_rect and self._img_prev_rect.collidepoint(mx, my):
-                self._change_image(-1)
+            if kind == "scroll":
+                self._scroll_group(*target)
                 return True
-            if self._img_next_rect and self._img_next_rect.collidepoint(mx, my):
-                self._change_image(1)
+            if kind == "image":
+                self._change_image(target)
                 return True
             
-            # 2. Source Buttons
-            for idx, rect in self._src_rects.items():
-                if rect.collidepoint(mx, my):
-                    self.selected = idx
-                    item = self.items[idx]
-                    item["src_value"] = (item["src_value"] + 1) % 3
-                    return True
-            
-            # 3. Toggle Switches
-            for idx, rect in self._toggle_rects.items():
-                if rect.collidepoint(mx, my):
-                    self.selected = idx
-                    item = self.items[idx]
-                    item["value"] = 0.0 if item["value"] > 0.5 else 1.0
-                    return True
-
-            # 4. Sliders
-            for idx, rect in self._slider_bar_rects.items():
-                if rect.collidepoint(mx, my):
-                    self.selected = idx
-                    self.dragging_slider = idx
-                    self._set_slider_from_mouse(idx, mx)
-                    return True
-
-            # 5. General Item Click
-            for idx, rect, itype in self._item_rects:
-                if rect.collidepoint(mx, my):
-                    self.selected = idx
-                    return True
-            
+            # Everything else is a click on an item row
+            self.selected = target
+            item = self.items[target]
+            if kind == "src":
+                item["src_value"] = (item["src_value"] + 1) % 3
+                self._changed_keys.add(item["src_key"])
+            elif kind == "toggle":
+                item["value"] = 0.0 if item["value"] > 0.5 else 1.0
+                self._changed_keys.add(item["key"])
+            elif kind == "slider":
+                self.dragging_slider = target
+                self._set_slider_from_mouse(target, mx)
             return True
         
         if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
@@ -360,6 +568,45 @@ class Menu:
         
         return False
     
+    def _hit_test(self, mx, my):
+        """Find what a click at (mx, my) lands on, in priority order.
+        
+        Returns (kind, target) or None: ("scroll", (group, delta)),
+        ("image", delta), or ("src" | "toggle" | "slider" | "item", index).
+        """
+        # Scroll arrows and image buttons
+        for group_name, arrows in self._scroll_arrow_rects.items():
+            if "up" in arrows and arrows["up"].collidepoint(mx, my):
+                return ("scroll", (group_name, -1))
+            if "down" in arrows and arrows["down"].collidepoint(mx, my):
+                return ("scroll", (group_name, 1))
+        if self._img_prev_rect and self._img_prev_rect.collidepoint(mx, my):
+            return ("image", -1)
+        if self._img_next_rect and self._img_next_rect.collidepoint(mx, my):
+            return ("image", 1)
+        
+        # Everything else lives inside one item row
+        idx = self._row_at(mx, my)
+        if idx < 0:
+            return None
+        for kind, rects in (("src", self._src_rects), ("toggle", self._toggle_rects),
+                            ("slider", self._slider_bar_rects)):
+            rect = rects.get(idx)
+            if rect and rect.collidepoint(mx, my):
+                return (kind, idx)
+        return ("item", idx)
+    
+    def _row_at(self, mx, my):
+        """Return the index of the item whose row contains (mx, my), or -1."""
+        # Rows are stacked top to bottom without overlap: the only candidate
+        # is the last one starting at or above my
+        pos = bisect.bisect_right(self._row_tops, my) - 1
+        if pos >= 0:
+            idx, rect, _ = self._item_rects[pos]
+            if rect.collidepoint(mx, my):
+                return idx
+        return -1
+    
     def _set_slider_from_mouse(self, idx, mx):
         """Set slider value based on mouse X position."""
         if idx not in self._slider_bar_rects:
@@ -370,23 +617,40 @@ class Menu:
         pct = (mx - bar_rect.x) / max(bar_rect.width, 1)
         pct = max(0.0, min(1.0, pct))
         
-        raw = item["min"] + pct * (item["max"] - item["min"])
-        item["value"] = round(round(raw / item["step"]) * item["step"], 2)
-        item["value"] = max(item["min"], min(item["max"], item["value"]))
+        lo, hi, per_unit = self._slider_steps[idx]
+        item["value"] = int(lo + pct * (hi - lo) + 0.5) / per_unit
+        self._changed_keys.add(item["key"])
+        self.dirty = True
     
     def render_surface(self, screen_w, screen_h):
-        """Render menu to a Pygame RGBA surface."""
-        panel_w = min(500, screen_w - 40)
-        panel_h = min(660, screen_h - 40)
-        pad = 20
+        """Render the menu panel to a Pygame RGBA surface.
         
-        surface = pygame.Surface((screen_w, screen_h), pygame.SRCALPHA)
+        Returns (panel surface, (x, y) of the panel on screen), or None while
+        the menu is hidden. Only the panel is drawn, not the transparent
+        screen around it. The result is cached: it is only redrawn (and
+        render_count incremented) when something changed.
+        """
+        if not self.visible:
+            return None
+        if not self.dirty and self._cached_surface is not None and self._cached_screen == (screen_w, screen_h):
+            return self._cached_surface
+        self.dirty = False
+        self.render_count += 1
+        
+        # At least 1x1: a Surface can't be empty, even in a tiny window
+        panel_w = max(1, min(500, screen_w - 40))
+        panel_h = max(1, min(660, screen_h - 40))
+        pad = 20
         
-        px = (screen_w - panel_w) // 2
-        py = (screen_h - panel_h) // 2
+        # Layout and drawing use panel coordinates (px = py = 0); the rects
+        # kept for hit-testing are moved to screen coordinates at the end
+        screen_x = (screen_w - panel_w) // 2
+        screen_y = (screen_h - panel_h) // 2
+        px = py = 0
         
-        self._panel_rect = pygame.Rect(px, py, panel_w, panel_h)
+        self._panel_rect = pygame.Rect(screen_x, screen_y, panel_w, panel_h)
         self._item_rects = []
+        self._row_tops = []
         self._slider_bar_rects = {}
         self._toggle_rects = {}
         self._src_rects = {}
@@ -395,136 +659,156 @@ class Menu:
         self._scroll_arrow_rects = {}
         self._group_area_rects = {}
         
-        # Background
-        pygame.draw.rect(surface, self.bg_color, self._panel_rect, border_radius=14)
-        pygame.draw.rect(surface, (100, 80, 180, 100), self._panel_rect, 2, border_radius=14)
-        
-        # Title
-        title = self.font_title.render("⚙  EFECTOS & AJUSTES", True, self.title_color)
-        surface.blit(title, (px + (panel_w - title.get_width()) // 2, py + pad))
+        # Background, title and hints
+        if self._panel_base is None or self._panel_base.get_size() != (panel_w, panel_h):
+            self._panel_base = self._render_panel_base(panel_w, panel_h, pad)
+        # Draw into the same buffer every time (the caller copies it to the
+        # GPU right away); blitting onto cleared pixels copies the base exactly
+        surface = self._panel_buf
+        if surface is None or surface.get_size() != (panel_w, panel_h):
+            surface = self._panel_buf = pygame.Surface((panel_w, panel_h), pygame.SRCALPHA)
+        else:
+            surface.fill((0, 0, 0, 0))
+        surface.blit(self._panel_base, (0, 0))
         
         sep_y = py + pad + 32
-        pygame.draw.line(surface, (80, 60, 140, 120), (px + pad, sep_y), (px + panel_w - pad, sep_y), 1)
         
         # Items
         item_y = sep_y + 12
         bar_w = panel_w - pad * 2 - 200
         item_h = 32
         arrow_h = 18  # Height for scroll arrows
+        text_blits = []  # (surface, pos), blitted together at the end
         
         # Pre-compute which groups need scrolling and their visible ranges
         group_visible_range = {}  # {group: (offset, count_visible, total)}
         for group_name, max_vis in self._group_max_visible.items():
-            group_items = self._get_group_items(group_name)
-            total = len(group_items)
+            total = len(self._group_index.get(group_name, ()))
             offset = self._scroll_offsets.get(group_name, 0)
             count_vis = min(max_vis, total)
             group_visible_range[group_name] = (offset, count_vis, total)
         
-        # Track which group we've already started rendering (for arrows)
-        groups_started = set()
-        groups_ended = set()
-        
-        i = 0
-        while i < len(self.items):
-            item = self.items[i]
-            
+        items = self.items
+        group_index = self._group_index
+        render_item = self._render_item
+        for kind, target in self._layout:
             # --- Separator ---
-            if item["type"] == "separator":
+            if kind == "separator":
                 sep_line_y = item_y + 8
                 pygame.draw.line(surface, self.separator_color,
                                  (px + pad + 10, sep_line_y),
                                  (px + panel_w - pad - 10, sep_line_y), 1)
                 item_y += 18
-                i += 1
                 continue
             
-            group = item.get("group")
-            
-            # --- Handle scrollable group ---
-            if group and group in self._group_max_visible and group not in groups_started:
-                groups_started.add(group)
-                offset, count_vis, total = group_visible_range[group]
-                needs_scroll = total > count_vis
-                
-                # Record group area start
-                group_area_y_start = item_y
-                
-                # ▲ Arrow (if items hidden above)
-                if needs_scroll and offset > 0:
-                    arrow_rect = pygame.Rect(px + pad, item_y, panel_w - pad * 2, arrow_h)
-                    self._scroll_arrow_rects.setdefault(group, {})["up"] = arrow_rect
-                    # Draw arrow
-                    arrow_txt = self.font_arrow.render("▲  ▲  ▲", True, self.arrow_color)
-                    surface.blit(arrow_txt, (px + (panel_w - arrow_txt.get_width()) // 2, item_y))
-                    item_y += arrow_h
-                elif needs_scroll:
-                    # Reserve space but show nothing (keeps layout stable)
-                    item_y += arrow_h
-                
-                # Render only the visible items in this group
-                group_items = self._get_group_items(group)
-                visible_items = group_items[offset:offset + count_vis]
-                
-                for gi, gitem in visible_items:
-                    item_y = self._render_item(surface, gi, gitem, item_y, px, py,
-                                               pad, panel_w, bar_w, item_h)
-                
-                # ▼ Arrow (if items hidden below)
-                if needs_scroll and offset + count_vis < total:
-                    arrow_rect = pygame.Rect(px + pad, item_y, panel_w - pad * 2, arrow_h)
-                    self._scroll_arrow_rects.setdefault(group, {})["down"] = arrow_rect
-                    arrow_txt = self.font_arrow.render("▼  ▼  ▼", True, self.arrow_color)
-                    surface.blit(arrow_txt, (px + (panel_w - arrow_txt.get_width()) // 2, item_y))
-                    item_y += arrow_h
-                elif needs_scroll:
-                    item_y += arrow_h
-                
-                # Record group area for mouse wheel detection
-                self._group_area_rects[group] = pygame.Rect(
-                    px, group_area_y_start, panel_w, item_y - group_area_y_start
-                )
-                
-                # Skip all items in this group (we already rendered the visible ones)
-                groups_ended.add(group)
-                # Advance i past all items in this group
-                while i < len(self.items) and self.items[i].get("group") == group:
-                    i += 1
+            # --- Normal (non-grouped) item ---
+            if kind == "item":
+                item_y = render_item(surface, text_blits, target, items[target], item_y, px, py,
+                                     pad, panel_w, bar_w, item_h)
                 continue
             
-            # If this item belongs to a group we already rendered, skip it
-            if group and group in groups_ended:
-                i += 1
-                continue
+            # --- Scrollable group ---
+            group = target
+            offset, count_vis, total = group_visible_range[group]
+            needs_scroll = total > count_vis
             
-            # --- Normal (non-grouped) item ---
-            item_y = self._render_item(surface, i, item, item_y, px, py,
-                                       pad, panel_w, bar_w, item_h)
-            i += 1
+            # Record group area start
+            group_area_y_start = item_y
+            
+            # ▲ Arrow (if items hidden above)
+            if needs_scroll and offset > 0:
+                arrow_rect = pygame.Rect(px + pad, item_y, panel_w - pad * 2, arrow_h)
+                self._scroll_arrow_rects.setdefault(group, {})["up"] = arrow_rect
+                # Draw arrow
+                arrow_txt = self._arrow_up_surf
+                text_blits.append((arrow_txt, (px + (panel_w - arrow_txt.get_width()) // 2, item_y)))
+                item_y += arrow_h
+            elif needs_scroll:
+                # Reserve space but show nothing (keeps layout stable)
+                item_y += arrow_h
+            
+            # Render only the visible items in this group
+            for gi in group_index[group][offset:offset + count_vis]:
+                item_y = render_item(surface, text_blits, gi, items[gi], item_y, px, py,
+                                     pad, panel_w, bar_w, item_h)
+            
+            # ▼ Arrow (if items hidden below)
+            if needs_scroll and offset + count_vis < total:
+                arrow_rect = pygame.Rect(px + pad, item_y, panel_w - pad * 2, arrow_h)
+                self._scroll_arrow_rects.setdefault(group, {})["down"] = arrow_rect
+                arrow_txt = self._arrow_down_surf
+                text_blits.append((arrow_txt, (px + (panel_w - arrow_txt.get_width()) // 2, item_y)))
+                item_y += arrow_h
+            elif needs_scroll:
+                item_y += arrow_h
+            
+            # Record group area for mouse wheel detection
+            self._group_area_rects[group] = pygame.Rect(
+                px, group_area_y_start, panel_w, item_y - group_area_y_start
+            )
+        
+        # All text goes on top of the shapes in one call
+        surface.blits(text_blits, doreturn=False)
+        
+        # Hit-test rects to screen coordinates
+        offset = (screen_x, screen_y)
+        for _, rect, _ in self._item_rects:
+            rect.move_ip(offset)
+        self._row_tops = [top + screen_y for top in self._row_tops]
+        for rects in (self._slider_bar_rects, self._toggle_rects, self._src_rects,
+                      self._group_area_rects):
+            for rect in rects.values():
+                rect.move_ip(offset)
+        for arrows in self._scroll_arrow_rects.values():
+            for rect in arrows.values():
+                rect.move_ip(offset)
+        for rect in (self._img_prev_rect, self._img_next_rect):
+            if rect:
+                rect.move_ip(offset)
+        
+        self._cached_surface = (surface, (screen_x, screen_y))
+        self._cached_screen = (screen_w, screen_h)
+        return self._cached_surface
+    
+    def _render_panel_base(self, panel_w, panel_h, pad):
+        """Render the parts of the panel that never change into a panel-sized surface."""
+        base = pygame.Surface((panel_w, panel_h), pygame.SRCALPHA)
+        rect = base.get_rect()
+        
+        # Background
+        pygame.draw.rect(base, self.bg_color, rect, border_radius=14)
+        pygame.draw.rect(base, self.border_color, rect, 2, border_radius=14)
+        
+        # Title
+        title = self._title_surf
+        base.blit(title, ((panel_w - title.get_width()) // 2, pad))
+        
+        sep_y = pad + 32
+        pygame.draw.line(base, self.line_color, (pad, sep_y), (panel_w - pad, sep_y), 1)
         
         # Hints at bottom
-        hint_y = py + panel_h - 44
-        pygame.draw.line(surface, (80, 60, 140, 120),
-                         (px + pad, hint_y - 8), (px + panel_w - pad, hint_y - 8), 1)
+        hint_y = panel_h - 44
+        pygame.draw.line(base, self.line_color,
+                         (pad, hint_y - 8), (panel_w - pad, hint_y - 8), 1)
         
-        hints = [
-            "[←/→] Navegar Fondo   [Click/S] Fuente",
-            "[F] Pantalla Comp.  [B] Sin bordes"
-        ]
-        for hint_text in hints:
-            hint = self.font_hint.render(hint_text, True, self.hint_color)
-            surface.blit(hint, (px + (panel_w - hint.get_width()) // 2, hint_y))
+        for hint in self._hint_surfs:
+            base.blit(hint, ((panel_w - hint.get_width()) // 2, hint_y))
             hint_y += 18
         
-        return surface
+        return base
     
-    def _render_item(self, surface, i, item, item_y, px, py, pad, panel_w, bar_w, item_h):
-        """Render a single menu item. Returns the new item_y after this item."""
+    def _render_item(self, surface, text_blits, i, item, item_y, px, py, pad, panel_w, bar_w, item_h):
+        """Render a single menu item. Returns the new item_y after this item.
+        
+        Shapes are drawn right away; text is appended to text_blits as
+        (surface, pos) and drawn by the caller in one batch.
+        """
         is_selected = (i == self.selected)
         is_hovered = (i == self.hovered)
         
         full_rect = pygame.Rect(px + 4, item_y - 2, panel_w - 8, item_h)
-        self._item_rects.append((i, full_rect, item["type"]))
+        self._item_rects.append((i, full_rect, self._types[i]))
+        self._row_tops.append(full_rect.y)
         
         # Colors
         if is_selected:
@@ -536,17 +820,17 @@ class Menu:
         
         # Highlight background
         if is_selected or is_hovered:
-            bg_alpha = 70 if is_selected else 30
-            pygame.draw.rect(surface, (40, 60, 100, bg_alpha), full_rect, border_radius=6)
+            highlight = self.highlight_selected if is_selected else self.highlight_hovered
+            pygame.draw.rect(surface, highlight, full_rect, border_radius=6)
         
         # Selection indicator
         if is_selected:
-            indicator = self.font_item.render("►", True, self.selected_color)
-            surface.blit(indicator, (px + 8, item_y + 1))
+            indicator = self._text(self.font_item, "►", self.selected_color)
+            text_blits.append((indicator, (px + 8, item_y + 1)))
         
         # Label
-        label = self.font_item.render(item["label"], True, color)
-        surface.blit(label, (px + pad + 14, item_y))
+        label = self._text(self.font_item, item["label"], color)
+        text_blits.append((label, (px + pad + 14, item_y)))
         
         # --- Type Specific Rendering ---
         
@@ -557,69 +841,53 @@ class Menu:
             
             # "Sig >" button
             next_rect = pygame.Rect(right_edge - btn_w, item_y + 3, btn_w, btn_h)
-            pygame.draw.rect(surface, (60, 60, 100), next_rect, border_radius=5)
-            pygame.draw.rect(surface, (100, 80, 180, 160), next_rect, 1, border_radius=5)
-            next_txt = self.font_small.render("Sig >", True, (200, 200, 240))
-            surface.blit(next_txt, (next_rect.x + (btn_w - next_txt.get_width()) // 2,
-                                     next_rect.y + (btn_h - next_txt.get_height()) // 2))
+            surface.blit(self._rrect(btn_w, btn_h, 5, self.button_color), next_rect)
+            pygame.draw.rect(surface, self.button_border_color, next_rect, 1, border_radius=5)
+            next_txt = self._text(self.font_small, "Sig >", self.button_text_color)
+            text_blits.append((next_txt, (next_rect.x + (btn_w - next_txt.get_width()) // 2,
+                                               next_rect.y + (btn_h - next_txt.get_height()) // 2)))
             self._img_next_rect = next_rect
             
             # "< Ant" button
             prev_rect = pygame.Rect(right_edge - btn_w * 2 - 10, item_y + 3, btn_w, btn_h)
-            pygame.draw.rect(surface, (60, 60, 100), prev_rect, border_radius=5)
-            pygame.draw.rect(surface, (100, 80, 180, 160), prev_rect, 1, border_radius=5)
-            prev_txt = self.font_small.render("< Ant", True, (200, 200, 240))
-            surface.blit(prev_txt, (prev_rect.x + (btn_w - prev_txt.get_width()) // 2,
-                                     prev_rect.y + (btn_h - prev_txt.get_height()) // 2))
+            surface.blit(self._rrect(btn_w, btn_h, 5, self.button_color), prev_rect)
+            pygame.draw.rect(surface, self.button_border_color, prev_rect, 1, border_radius=5)
+            prev_txt = self._text(self.font_small, "< Ant", self.button_text_color)
+            text_blits.append((prev_txt, (prev_rect.x + (btn_w - prev_txt.get_width()) // 2,
+                                               prev_rect.y + (btn_h - prev_txt.get_height()) // 2)))
             self._img_prev_rect = prev_rect
             
             # Image name
             img_name = self.get_current_image_name()
             if len(img_name) > 18:
                 img_name = img_name[:16] + "…"
-            name_surf = self.font_hint.render(img_name, True, (160, 180, 220))
+            name_surf = self._text(self.font_hint, img_name, self.image_name_color)
             name_x = prev_rect.x - name_surf.get_width() - 10
-            surface.blit(name_surf, (name_x, item_y + 7))
+            text_blits.append((name_surf, (name_x, item_y + 7)))
         
         elif item["type"] in ("toggle", "effect_row"):
             # Toggle Switch
             tog_x = px + panel_w - pad - 50
             tog_w, tog_h = 40, 20
             is_on = item["value"] > 0.5
-            tog_color = self.toggle_on if is_on else self.toggle_off
             
             tog_rect = pygame.Rect(tog_x, item_y + 5, tog_w, tog_h)
-            pygame.draw.rect(surface, tog_color, tog_rect, border_radius=10)
+            surface.blit(self._toggle_surf_on if is_on else self._toggle_surf_off, tog_rect)
             self._toggle_rects[i] = tog_rect
             
-            # Knob
-            knob_x = tog_x + tog_w - 18 if is_on else tog_x + 2
-            knob_rect = pygame.Rect(knob_x, item_y + 7, 16, 16)
-            pygame.draw.rect(surface, (255, 255, 255, 230), knob_rect, border_radius=8)
-            
             # Source Selector button (effect_row only)
             if item["type"] == "effect_row":
-                src_val = item["src_value"]
-                src_color = self.src_colors[src_val]
-                src_label = self.src_labels[src_val]
-                
                 btn_w = 40
                 btn_h = 20
                 btn_x = tog_x - btn_w - 20
                 btn_rect = pygame.Rect(btn_x, item_y + 5, btn_w, btn_h)
                 self._src_rects[i] = btn_rect
-                
-                pygame.draw.rect(surface, src_color, btn_rect, border_radius=4)
-                
-                txt_surf = self.font_small.render(src_label, True, (20, 20, 30))
-                txt_x = btn_x + (btn_w - txt_surf.get_width()) // 2
-                txt_y = item_y + 5 + (btn_h - txt_surf.get_height()) // 2
-                surface.blit(txt_surf, (txt_x, txt_y))
+                surface.blit(self._src_button_surfs[item["src_value"]], btn_rect)
 
         elif item["type"] == "slider":
             bar_x = px + pad + 180
             bar_rect = pygame.Rect(bar_x, item_y + 8, bar_w, 12)
-            pygame.draw.rect(surface, self.bar_bg, bar_rect, border_radius=4)
+            surface.blit(self._rrect(bar_w, 12, 4, self.bar_bg), bar_rect)
             self._slider_bar_rects[i] = bar_rect
             
             pct = (item["value"] - item["min"]) / (item["max"] - item["min"])
@@ -627,16 +895,16 @@ class Menu:
             if fill_w > 0:
                 fill_color = self.bar_fill_selected if is_selected else self.bar_fill
                 fill_rect = pygame.Rect(bar_x, item_y + 8, fill_w, 12)
-                pygame.draw.rect(surface, fill_color, fill_rect, border_radius=4)
+                surface.blit(self._rrect(fill_w, 12, 4, fill_color), fill_rect)
             
             # Knob
             knob_cx = bar_x + fill_w
             knob_cy = item_y + 8 + 6
-            pygame.draw.circle(surface, (220, 220, 255), (knob_cx, knob_cy), 8)
+            pygame.draw.circle(surface, self.slider_knob_color, (knob_cx, knob_cy), 8)
             
             # Value text
             val_text = f"{int(item['value'] * 100)}%" if item["key"] != "sensitivity" else f"{item['value']}x"
-            pct_text = self.font_hint.render(val_text, True, color)
-            surface.blit(pct_text, (bar_x + bar_w + 12, item_y + 5))
+            pct_text = self._text(self.font_hint, val_text, color)
+            text_blits.append((pct_text, (bar_x + bar_w + 12, item_y + 5)))
         
         return item_y + item_h + 4
@@ -1,8 +1,13 @@
 import sys
+from functools import lru_cache
 from pathlib import Path
 
+@lru_cache(maxsize=1)
 def get_base_path():
-    """Get the base path for resources, handling both dev and PyInstaller environments."""
+    """Get the base path for resources, handling both dev and PyInstaller environments.
+    
+    The answer can't change while the process runs, so it is computed once.
+    """
     if getattr(sys, 'frozen', False):
         # Running as compiled exe
         # If --onedir, sys.executable is the exe path.
@@ -3,7 +3,8 @@ TEST: Gráficos con audio simulado y spectrum.
 Presiona TAB para abrir el menú y activar barras/círculo.
 """
 import pygame
-import math
+import queue
+import threading
 import time
 import sys
 import numpy as np
@@ -11,6 +12,9 @@ import numpy as np
 sys.path.insert(0, '.')
 from src.graphics import GraphicsEngine
 
+# Console level bars, indexed by how many of the 20 cells are filled
+BARS = tuple("#" * n + "." * (20 - n) for n in range(21))
+
 def main():
     print("=== TEST: GRAFICOS + SPECTRUM ===")
     print("TAB = Menú | Activa Barras/Círculo desde el menú")
@@ -20,41 +24,150 @@ def main():
     graphics = GraphicsEngine()
     print("Ventana abierta.\n")
     
-    running = True
-    start = time.time()
+    # Simulated spectrum: each bin is a sine with its own frequency/phase.
+    # The bins are synthesized directly, not taken from an FFT of a fake
+    # signal: with the oscillator below a bin costs one multiply-subtract
+    # per frame, cheaper than filling and transforming a sample buffer, and
+    # every bar moves smoothly (the app's real FFT path is src/audio.py).
+    FREQS = 0.5 + np.arange(64, dtype=np.float32) * 0.15
+    PHASES = np.arange(64, dtype=np.float32) * 0.3
+    # Base bins have more energy (like real audio). The falloff is positive,
+    # so it folds into the sine's scale and offset:
+    # max(0, s * 0.6 + 0.3) * f == max(0, s * (0.6 * f) + 0.3 * f)
+    FALLOFF = np.linspace(1.0, 0.3, 64, dtype=np.float32)
+    SPEC_A = 0.6 * FALLOFF
+    SPEC_B = 0.3 * FALLOFF
     
-    while running:
-        t = time.time() - start
-        
-        # Simular bass/mid/treble
-        bass = max(0, math.sin(t * 2.0) * 0.8 + 0.2) ** 2
-        mid = max(0, math.sin(t * 3.5) * 0.5 + 0.3)
-        treble = max(0, math.sin(t * 7.0) * 0.4 + 0.2)
-        
-        # Simular 64 bins de spectrum (ondas a diferentes frecuencias)
-        spectrum = np.zeros(64, dtype=np.float32)
-        for i in range(64):
-            freq = 0.5 + i * 0.15
-            phase = i * 0.3
-            spectrum[i] = max(0, math.sin(t * freq + phase) * 0.6 + 0.3)
+    # Every simulated signal is max(0, sin(t * F + P) * A + B), so they are
+    # all computed as one vector per frame: bass, mid, treble, beat, then
+    # the 64 bins
+    SIG_F = np.concatenate(([2.0, 3.5, 7.0, 3.0], FREQS)).astype(np.float32)
+    SIG_P = np.concatenate(([0.0, 0.0, 0.0, 0.0], PHASES)).astype(np.float32)
+    SIG_A = np.concatenate(([0.8, 0.5, 0.4, 1.0], SPEC_A)).astype(np.float32)
+    SIG_B = np.concatenate(([0.2, 0.3, 0.2, 0.0], SPEC_B)).astype(np.float32)
+    
+    # The sines advance in fixed steps of DT with the recurrence
+    # sin(x + w) = 2 cos(w) sin(x) - sin(x - w), so a step costs a multiply
+    # and a subtract per signal instead of a sin(). Rounding error slowly
+    # accumulates, so every RESYNC steps they are recomputed exactly.
+    RATE = 60  # Steps per second
+    DT = 1.0 / RATE
+    RESYNC = 600
+    OSC_W = SIG_F.astype(np.float64) * DT  # Phase advance per step (w)
+    OSC_P = SIG_P.astype(np.float64)
+    OSC_C = 2.0 * np.cos(OSC_W)
+    
+    # The next frame is synthesized on a worker thread while the main
+    # thread renders the current one. Rendering stays on the main thread:
+    # the OpenGL context and the SDL event queue belong to it.
+    frames = queue.Queue(maxsize=1)
+    stop = threading.Event()
+    
+    def synth_loop():
+        # Output ring, so frames are queued without a copy. Three buffers:
+        # while one is written here, the queue can hold another and the
+        # renderer can still be reading a third. Each entry keeps its views:
+        # (signals, levels, spectrum, low bins the beat pulse lifts), plus
+        # the float16 copy of the spectrum that is handed to render() (bar
+        # heights don't need more, and it's half the bytes).
+        ring = []
+        for _ in range(3):
+            signals = np.empty(4 + 64, dtype=np.float32)
+            ring.append((signals, signals[:4], signals[4:], signals[4:20],
+                         np.empty(64, dtype=np.float16)))
         
-        # Base bins have more energy (like real audio)
-        falloff = np.linspace(1.0, 0.3, 64).astype(np.float32)
-        spectrum *= falloff
+        # Oscillator state (float64, to keep the drift small): the sines at
+        # steps n - 1 and n, plus the row the next step is written to. One
+        # contiguous block, one row per quantity across all signals; the
+        # names rotate over the rows.
+        state = np.empty((3, 4 + 64))
+        s_prev, s_curr, s_next = state
         
-        # Add beat pulse to low bins
-        beat = max(0, math.sin(t * 3.0)) ** 4
-        spectrum[:16] += beat * 0.5
-        spectrum = np.clip(spectrum, 0, 1.5)
+        def resync(n):
+            np.sin(OSC_W * (n - 1) + OSC_P, out=s_prev)
+            np.sin(OSC_W * n + OSC_P, out=s_curr)
         
-        # Print (sparse)
-        frame_num = int(t * 60)
-        if frame_num % 60 == 0:
-            bar_b = "#" * int(min(bass, 1) * 20) + "." * (20 - int(min(bass, 1) * 20))
-            print(f"  Bass [{bar_b}] {bass:.2f}  t={t:.1f}s")
+        step = 0
+        resync(step)
+        frame = 0
+        # Monotonic clock: t never jumps when the system time is adjusted
+        perf_counter, sleep = time.perf_counter, time.sleep
+        start = perf_counter()
+        # Locals for the per-frame calls (no global/attribute lookups)
+        multiply, maximum, minimum, copyto = np.multiply, np.maximum, np.minimum, np.copyto
+        stopped = stop.is_set
         
+        while not stopped():
+            frame += 1
+            signals, levels, spectrum, low_bins, spectrum_out = ring[frame % 3]
+            
+            # Catch up to the clock in DT steps: usually one per frame. If
+            # no step is due yet, sleep until the next one rather than
+            # queue an identical frame, so the demo runs at most at 1/DT
+            # fps whatever the display's refresh rate. After a long stall,
+            # jump.
+            now = perf_counter() - start
+            target = int(now * RATE)
+            if target <= step and frame > 1:
+                sleep(max(0.0, (step + 1) * DT - now))
+                target = step + 1
+            if target - step > RESYNC:
+                step = target
+                resync(step)
+            while step < target:
+                multiply(OSC_C, s_curr, out=s_next)
+                s_next -= s_prev
+                s_prev, s_curr, s_next = s_curr, s_next, s_prev
+                step += 1
+                if step % RESYNC == 0:
+                    resync(step)
+            t = step * DT
+            
+            # Simular bass/mid/treble, el pulso y 64 bins de spectrum
+            # (ondas a diferentes frecuencias)
+            multiply(s_curr, SIG_A, out=signals, casting='same_kind')
+            signals += SIG_B
+            maximum(signals, 0.0, out=signals)
+            bass, mid, treble, beat = levels.tolist()
+            bass *= bass
+            
+            # Add beat pulse to low bins (beat ** 4 as two squarings)
+            beat *= beat
+            low_bins += beat * beat * 0.5
+            # Already >= 0 (clamped above, and the pulse is >= 0): cap only
+            minimum(spectrum, 1.5, out=spectrum)
+            copyto(spectrum_out, spectrum, casting='same_kind')
+            
+            # Print (every 60 frames, starting with the first)
+            if frame % 60 == 1:
+                print(f"  Bass [{BARS[int(min(bass, 1) * 20)]}] {bass:.2f}  t={t:.1f}s")
+            
+            # Blocks while the renderer is a frame behind; wakes up now and
+            # then to notice the window was closed
+            item = (bass, mid, treble, spectrum_out)
+            while not stopped():
+                try:
+                    frames.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+    
+    synth = threading.Thread(target=synth_loop, daemon=True)
+    synth.start()
+    
+    running = True
+    while running:
+        # Poll so the loop ends if the synth thread dies instead of
+        # waiting forever for a frame that will never come
+        try:
+            bass, mid, treble, spectrum = frames.get(timeout=0.1)
+        except queue.Empty:
+            running = synth.is_alive()
+            continue
         running = graphics.render(bass, mid, treble, spectrum)
     
+    stop.set()
+    synth.join()
     pygame.quit()
     print("\n=== DONE ===")
 